@@ -2,13 +2,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from pathlib import Path
 
 st.set_page_config(page_title="NYC Audit 2025", layout="wide")
 st.title("🚕 NYC Congestion Pricing Audit 2025")
 
 # Check if data exists
-if not Path("outputs/clean_data.parquet").exists():
+REQUIRED_OUTPUTS = ["clean_data", "hourly", "revenue_hourly", "top_zones"]
+if not all(Path(f"outputs/{name}.parquet").exists() for name in REQUIRED_OUTPUTS):
     st.warning("⚠️ No data found!")
     st.info("Please run 'python pipeline.py' first to process the data.")
 
@@ -17,13 +21,83 @@ if not Path("outputs/clean_data.parquet").exists():
     st.stop()
 
 
+# Columns used by the dashboard - everything else stays on disk
+DASHBOARD_COLUMNS = ['hour', 'fare', 'trip_distance', 'avg_speed',
+                     'total_amount', 'congestion_surcharge', 'pickup_loc']
+
+
 # Load data
 @st.cache_data
 def load_data():
-    df = pd.read_parquet("outputs/clean_data.parquet")
+    arrow_path = Path("outputs/clean_data.arrow")
+    parquet_path = Path("outputs/clean_data.parquet")
+    # The IPC copy is written after the analysis steps - a failed rerun can
+    # leave one from the previous run, so only trust it if it is not older
+    if arrow_path.exists() and arrow_path.stat().st_mtime >= parquet_path.stat().st_mtime:
+        # Memory-mapped Arrow IPC: no decode, pages shared via the OS cache
+        source = pa.memory_map(str(arrow_path), "r")
+        table = pa.ipc.open_file(source).read_all()
+    else:
+        dataset = pq.ParquetDataset(parquet_path)
+        columns = [c for c in DASHBOARD_COLUMNS if c in dataset.schema.names]
+        table = dataset.read(columns=columns)
+    # self_destruct frees Arrow buffers as they are converted (no double copy)
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
     return df
 
 
+@st.cache_data
+def load_hourly():
+    return pd.read_parquet("outputs/hourly.parquet")
+
+
+@st.cache_data
+def load_revenue_hourly():
+    return pd.read_parquet("outputs/revenue_hourly.parquet")
+
+
+@st.cache_data
+def load_top_zones():
+    return pd.read_parquet("outputs/top_zones.parquet")
+
+
+@st.cache_data
+def count_ghost_trips():
+    # Row counts come from the parquet footers - no data pages are decoded
+    return ds.dataset("outputs/ghost_trips.parquet", format="parquet").count_rows()
+
+
+# Figures are cached per aggregate table, so reruns skip the rebuild
+@st.cache_data
+def hourly_bar(hourly):
+    return px.bar(hourly, x='Hour', y='Trip Count',
+                  title='Number of Trips by Hour of Day',
+                  labels={'Trip Count': 'Number of Trips'},
+                  color='Trip Count',
+                  color_continuous_scale='viridis')
+
+
+@st.cache_data
+def distance_line(hourly):
+    return px.line(hourly, x='Hour', y='Avg Distance',
+                   title='Average Trip Distance by Hour',
+                   markers=True)
+
+
+@st.cache_data
+def revenue_area(revenue_hourly):
+    return px.area(revenue_hourly, x='hour', y='total_amount',
+                   title='Total Revenue by Hour',
+                   labels={'total_amount': 'Revenue ($)', 'hour': 'Hour'})
+
+
+@st.cache_data
+def top_zones_bar(top_zones):
+    return px.bar(top_zones, x='Location ID', y='Trip Count',
+                  title='Top 10 Pickup Locations',
+                  color='Trip Count')
+
+
 df = load_data()
 
 st.success(f"✅ Loaded {len(df):,} trips from January 2025")
@@ -43,51 +117,32 @@ tab1, tab2, tab3 = st.tabs(["📊 Hourly Patterns", "💰 Revenue", "🗺️ Zon
 with tab1:
     st.header("Trip Patterns by Hour")
 
-    hourly = df.groupby('hour').agg({
-        'fare': 'count',
-        'trip_distance': 'mean'
-    }).reset_index()
-    hourly.columns = ['Hour', 'Trip Count', 'Avg Distance']
+    hourly = load_hourly()
 
-    fig = px.bar(hourly, x='Hour', y='Trip Count',
-                 title='Number of Trips by Hour of Day',
-                 labels={'Trip Count': 'Number of Trips'},
-                 color='Trip Count',
-                 color_continuous_scale='viridis')
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(hourly_bar(hourly), use_container_width=True)
 
     # Distance by hour
-    fig2 = px.line(hourly, x='Hour', y='Avg Distance',
-                   title='Average Trip Distance by Hour',
-                   markers=True)
-    st.plotly_chart(fig2, use_container_width=True)
+    st.plotly_chart(distance_line(hourly), use_container_width=True)
 
 with tab2:
     st.header("Revenue Analysis")
 
     # Revenue by hour
-    revenue_hourly = df.groupby('hour')['total_amount'].sum().reset_index()
+    revenue_hourly = load_revenue_hourly()
 
-    fig = px.area(revenue_hourly, x='hour', y='total_amount',
-                  title='Total Revenue by Hour',
-                  labels={'total_amount': 'Revenue ($)', 'hour': 'Hour'})
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(revenue_area(revenue_hourly), use_container_width=True)
 
     # Surcharge analysis
     if 'congestion_surcharge' in df.columns:
-        surcharge_total = df['congestion_surcharge'].sum()
+        surcharge_total = df['congestion_surcharge'].astype('float64').sum()
         st.metric("Total Congestion Surcharge Collected", f"${surcharge_total:,.2f}")
 
 with tab3:
     st.header("Top Pickup Locations")
 
-    top_zones = df.groupby('pickup_loc').size().nlargest(10).reset_index()
-    top_zones.columns = ['Location ID', 'Trip Count']
+    top_zones = load_top_zones()
 
-    fig = px.bar(top_zones, x='Location ID', y='Trip Count',
-                 title='Top 10 Pickup Locations',
-                 color='Trip Count')
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(top_zones_bar(top_zones), use_container_width=True)
 
 # Sidebar with audit info
 with st.sidebar:
@@ -95,8 +150,7 @@ with st.sidebar:
 
     # Ghost trip stats
     if Path("outputs/ghost_trips.parquet").exists():
-        ghost_df = pd.read_parquet("outputs/ghost_trips.parquet")
-        st.metric("Ghost Trips Detected", f"{len(ghost_df):,}")
+        st.metric("Ghost Trips Detected", f"{count_ghost_trips():,}")
 
     st.divider()
     st.markdown("### 🎯 Compliance")
@@ -108,4 +162,4 @@ with st.sidebar:
     st.markdown("**Period:** January 2025")
 
 st.divider()
-st.caption("Dashboard generated for NYC Congestion Pricing Audit | Data processed with Dask")
\ No newline at end of file
+st.caption("Dashboard generated for NYC Congestion Pricing Audit | Data processed with PyArrow (Dask for files over 4 GB)")
\ No newline at end of file
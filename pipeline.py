@@ -6,87 +6,169 @@ Processes 2025 taxi data for congestion pricing analysis
 
 import sys
 import os
+from datetime import datetime
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import dask
 import dask.dataframe as dd
+from numba import njit, prange
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
-from scraper import TLCScraper
+from scraper import TLCScraper, write_parquet
 
 # Congestion Zone: Manhattan South of 60th St
-CONGESTION_ZONE_IDS = [
+CONGESTION_ZONE_IDS = np.array([
     4, 12, 13, 24, 41, 42, 43, 45, 48, 50, 68, 74, 75, 79, 87, 88, 90, 100, 103,
     107, 113, 114, 116, 120, 125, 127, 128, 137, 140, 141, 142, 143, 144, 148, 151,
     152, 153, 158, 161, 162, 163, 164, 166, 170, 186, 194, 202, 209, 211, 224, 229,
     230, 231, 232, 233, 234, 236, 237, 238, 239, 243, 244, 246, 249, 261, 262, 263
-]
+], dtype=np.int16)
 
+# Congestion toll start date
+TOLL_START = datetime(2025, 1, 5)
 
-def detect_ghost_trips(df):
-    """Detect suspicious trips"""
-    print("\n👻 Detecting ghost trips...")
+# Columns needed for summary stats, dashboard tables and the dashboard itself
+SUMMARY_COLUMNS = ['hour', 'fare', 'trip_distance', 'avg_speed',
+                   'total_amount', 'congestion_surcharge', 'pickup_loc']
 
-    ghost_count = 0
+# Boolean lookup table indexed by location ID (covers the whole uint16 range)
+_ZONE_LUT = np.zeros(1 << 16, dtype=bool)
+_ZONE_LUT[CONGESTION_ZONE_IDS] = True
 
-    # 1. Impossible speed (>65 MPH)
-    mask_speed = df['avg_speed'] > 65
-    speed_count = mask_speed.sum()
 
-    # 2. Teleporter (<1 min, >$20 fare)
-    mask_teleport = (df['trip_duration'] < 1) & (df['fare'] > 20)
-    teleport_count = mask_teleport.sum()
+def in_congestion_zone(locs):
+    """Vectorised membership test for location IDs"""
+    return _ZONE_LUT[locs.to_numpy().astype(np.uint16)]
+
+
+def top_locations(locs, n):
+    """The n most frequent location IDs with their trip counts"""
+    counts = np.bincount(locs)
+    # Most trips first, lower ID first on ties (only ~265 bins to sort)
+    top = np.argsort(-counts, kind='stable')[:n]
+    top = top[counts[top] > 0]
+    return pd.Series(counts[top], index=top)
 
+
+@njit(cache=True)
+def _row_reason(speed, duration, distance, fare):
+    # 1. Impossible speed (>65 MPH, or distance covered in no time -
+    #    avg_speed is NaN there so the means stay clean)
+    if speed > 65.0 or (duration == 0.0 and distance > 0.0):
+        return 1
+    # 2. Teleporter (<1 min, >$20 fare)
+    if duration < 1.0 and fare > 20.0:
+        return 2
     # 3. Stationary (0 distance, >$0 fare)
-    mask_stationary = (df['trip_distance'] == 0) & (df['fare'] > 0)
-    stationary_count = mask_stationary.sum()
+    if distance == 0.0 and fare > 0.0:
+        return 3
+    return 0
+
 
-    # Combine
-    ghost_mask = mask_speed | mask_teleport | mask_stationary
+# Dask partitions already run on a thread pool, and numba's default threading
+# layer can't be entered from several threads at once - they use the serial
+# kernel. The two kernels are separate functions because numba's on-disk cache
+# is keyed per Python function, not per compile flags.
+@njit(parallel=True, boundscheck=False, cache=True)
+def _ghost_reason_parallel(speed, duration, distance, fare, out):
+    for i in prange(speed.shape[0]):
+        out[i] = _row_reason(speed[i], duration[i], distance[i], fare[i])
 
-    ghost_df = df[ghost_mask].copy()
-    clean_df = df[~ghost_mask].copy()
+
+@njit(boundscheck=False, cache=True)
+def _ghost_reason_serial(speed, duration, distance, fare, out):
+    for i in range(speed.shape[0]):
+        out[i] = _row_reason(speed[i], duration[i], distance[i], fare[i])
+
+
+def ghost_reason(df, parallel=True):
+    """Reason code per trip: 0 = clean, 1-3 = first rule that flagged it"""
+    reason = np.zeros(len(df), dtype=np.int8)
+    kernel = _ghost_reason_parallel if parallel else _ghost_reason_serial
+    kernel(df['avg_speed'].to_numpy(), df['trip_duration'].to_numpy(),
+           df['trip_distance'].to_numpy(), df['fare'].to_numpy(), reason)
+    return reason
+
+
+def detect_ghost_trips(data):
+    """Detect suspicious trips and write the clean/ghost outputs"""
+    print("\n👻 Detecting ghost trips...")
+
+    if isinstance(data, pa.Table):
+        reason = ghost_reason(data)
+        is_ghost = reason > 0
+        write_parquet(data.filter(~is_ghost), "outputs/clean_data.parquet")
+        write_parquet(data.filter(is_ghost).append_column(
+            'ghost_reason', pa.array(reason[is_ghost])), "outputs/ghost_trips.parquet")
+        counts = pd.Series(np.bincount(reason, minlength=4))
+    else:
+        ddf = data.assign(ghost_reason=data.map_partitions(
+            lambda p: pd.Series(ghost_reason(p, parallel=False), index=p.index),
+            meta=('ghost_reason', 'int8')
+        ))
+
+        clean = ddf[ddf['ghost_reason'] == 0].drop(columns='ghost_reason')
+        ghost = ddf[ddf['ghost_reason'] > 0]
+
+        # Both sinks share one scan of the source file
+        _, _, counts = dask.compute(
+            write_parquet(clean, "outputs/clean_data.parquet", compute=False),
+            write_parquet(ghost, "outputs/ghost_trips.parquet", compute=False),
+            ddf['ghost_reason'].value_counts()
+        )
+
+    clean_count, speed_count, teleport_count, stationary_count = (
+        counts.reindex(range(4), fill_value=0).tolist()
+    )
+    total = clean_count + speed_count + teleport_count + stationary_count
+    ghost_count = total - clean_count
 
     print(f"   Impossible speed (>65 MPH): {speed_count:,}")
     print(f"   Teleporter (<1 min, >$20): {teleport_count:,}")
     print(f"   Stationary (0 mi, >$0): {stationary_count:,}")
-    print(f"   Total removed: {len(ghost_df):,} ({len(ghost_df) / len(df) * 100:.2f}%)")
+    print(f"   Total removed: {ghost_count:,} ({ghost_count / total * 100:.2f}%)")
 
-    return clean_df, ghost_df
+    return clean_count, ghost_count
 
 
-def analyze_congestion_zone(df):
+def analyze_congestion_zone(path):
     """Analyze congestion zone trips"""
     print("\n🚕 Analyzing congestion zone...")
 
-    # Flag zone trips
-    df['pickup_in_zone'] = df['pickup_loc'].isin(CONGESTION_ZONE_IDS)
-    df['dropoff_in_zone'] = df['dropoff_loc'].isin(CONGESTION_ZONE_IDS)
-    df['enters_zone'] = (~df['pickup_in_zone']) & (df['dropoff_in_zone'])
+    # Post-toll analysis (after Jan 5, 2025) - earlier row groups are skipped
+    post_toll = ds.dataset(path, format="parquet").to_table(
+        columns=['pickup_loc', 'dropoff_loc', 'congestion_surcharge'],
+        filter=pc.field('pickup_time') >= pa.scalar(TOLL_START)
+    )
 
-    # Post-toll analysis (after Jan 5, 2025)
-    post_toll = df[df['pickup_time'] >= '2025-01-05']
-    zone_entries = post_toll[post_toll['enters_zone']]
+    # Zone entries: pickup outside the zone, dropoff inside
+    enters_zone = (~in_congestion_zone(post_toll['pickup_loc'])
+                   & in_congestion_zone(post_toll['dropoff_loc']))
+    entry_idx = np.flatnonzero(enters_zone)
 
-    if len(zone_entries) > 0:
-        compliant = zone_entries[zone_entries['congestion_surcharge'] > 0]
-        compliance_rate = len(compliant) / len(zone_entries)
+    if len(entry_idx) > 0:
+        surcharge = post_toll['congestion_surcharge'].to_numpy()[entry_idx]
+        compliant_count = int((surcharge > 0).sum())
+        compliance_rate = compliant_count / len(entry_idx)
 
-        print(f"   Zone entries after Jan 5: {len(zone_entries):,}")
-        print(f"   Compliant (with surcharge): {len(compliant):,}")
+        print(f"   Zone entries after Jan 5: {len(entry_idx):,}")
+        print(f"   Compliant (with surcharge): {compliant_count:,}")
         print(f"   Compliance rate: {compliance_rate:.2%}")
 
         # Top leakage locations
-        non_compliant = zone_entries[zone_entries['congestion_surcharge'] == 0]
-        if len(non_compliant) > 0:
-            top_leakage = non_compliant.groupby('pickup_loc').size().nlargest(3)
+        non_compliant_locs = post_toll['pickup_loc'].to_numpy()[entry_idx[surcharge == 0]]
+        if len(non_compliant_locs) > 0:
+            top_leakage = top_locations(non_compliant_locs, 3)
             print(f"\n   🔍 Top 3 leakage pickup locations:")
             for loc, count in top_leakage.items():
                 print(f"      Location {loc}: {count:,} trips")
 
-    return df
-
 
 def create_summary_stats(df):
     """Create summary statistics"""
@@ -95,13 +177,40 @@ def create_summary_stats(df):
     print(f"   Average fare: ${df['fare'].mean():.2f}")
     print(f"   Average trip distance: {df['trip_distance'].mean():.2f} miles")
     print(f"   Average speed: {df['avg_speed'].mean():.1f} MPH")
-    print(f"   Total revenue: ${df['total_amount'].sum():,.2f}")
+    # Money totals accumulate in float64 (columns are stored as float32)
+    total_revenue = df['total_amount'].astype('float64').sum()
+    print(f"   Total revenue: ${total_revenue:,.2f}")
 
     if 'congestion_surcharge' in df.columns:
-        total_surcharge = df['congestion_surcharge'].sum()
+        total_surcharge = df['congestion_surcharge'].astype('float64').sum()
         print(f"   Total congestion surcharge: ${total_surcharge:,.2f}")
 
 
+def create_dashboard_tables(df):
+    """Pre-aggregate the small tables the dashboard plots"""
+    # 24 hour bins - bincount sums the weights in float64
+    hour = df['hour'].to_numpy()
+    trip_count = np.bincount(hour, minlength=24)
+    distance_sum = np.bincount(hour, weights=df['trip_distance'].to_numpy(), minlength=24)
+
+    hourly = pd.DataFrame({
+        'Hour': np.arange(len(trip_count)),
+        'Trip Count': trip_count,
+        'Avg Distance': distance_sum / np.maximum(trip_count, 1),
+    })
+
+    revenue_hourly = pd.DataFrame({
+        'hour': np.arange(len(trip_count)),
+        'total_amount': np.bincount(hour, weights=df['total_amount'].to_numpy(),
+                                    minlength=24),
+    })
+
+    top_zones = top_locations(df['pickup_loc'].to_numpy(), 10).reset_index()
+    top_zones.columns = ['Location ID', 'Trip Count']
+
+    return hourly, revenue_hourly, top_zones
+
+
 def main():
     print("=" * 60)
     print("NYC Congestion Pricing Audit - Full Pipeline")
@@ -119,37 +228,54 @@ def main():
         print("❌ Download failed")
         return
 
-    # Process the file
-    processed = scraper.process_file(file)
+    # Load and prepare trips
+    data = scraper.load_file(file)
 
     # Phase 2: Analysis
     print("\n🔍 Phase 2: Analysis")
 
-    # Read processed data
-    print("   Reading processed data...")
-    df = pd.read_parquet(processed)
-    print(f"   Loaded {len(df):,} rows")
-
-    # Ghost trip detection
-    clean_df, ghost_df = detect_ghost_trips(df)
+    # Ghost trip detection (writes clean/ghost outputs)
+    detect_ghost_trips(data)
 
     # Congestion zone analysis
-    analyzed_df = analyze_congestion_zone(clean_df)
+    analyze_congestion_zone("outputs/clean_data.parquet")
+
+    # Read clean data
+    print("\n   Reading clean data...")
+    dataset = ds.dataset("outputs/clean_data.parquet", format="parquet")
+    columns = [c for c in SUMMARY_COLUMNS if c in dataset.schema.names]
+    clean_table = dataset.to_table(columns=columns)
+    clean_df = clean_table.to_pandas()
+    print(f"   Loaded {len(clean_df):,} rows")
+
+    # Arrow IPC copy of the same columns - the dashboard memory-maps it
+    with pa.OSFile("outputs/clean_data.arrow", "wb") as sink:
+        with pa.ipc.new_file(sink, clean_table.schema) as writer:
+            writer.write_table(clean_table)
 
     # Summary
-    create_summary_stats(analyzed_df)
+    create_summary_stats(clean_df)
+
+    # Dashboard aggregates
+    hourly, revenue_hourly, top_zones = create_dashboard_tables(clean_df)
 
     # Save results
     print("\n💾 Saving results...")
-    clean_df.to_parquet("outputs/clean_data.parquet", index=False)
-    ghost_df.to_parquet("outputs/ghost_trips.parquet", index=False)
+    for name, table in [("hourly", hourly), ("revenue_hourly", revenue_hourly),
+                        ("top_zones", top_zones)]:
+        write_parquet(pa.Table.from_pandas(table, preserve_index=False),
+                      f"outputs/{name}.parquet")
 
     print("\n" + "=" * 60)
     print("✅ Pipeline Complete!")
     print("=" * 60)
     print("📁 Output files:")
     print("   - outputs/clean_data.parquet")
+    print("   - outputs/clean_data.arrow")
     print("   - outputs/ghost_trips.parquet")
+    print("   - outputs/hourly.parquet")
+    print("   - outputs/revenue_hourly.parquet")
+    print("   - outputs/top_zones.parquet")
     print("\n🚀 Next: Run 'python dashboard.py' to see visualizations")
 
 
@@ -1,9 +1,103 @@
 import requests
 import os
+import shutil
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import dask.dataframe as dd
 
+# Files above this size are processed out-of-core with Dask
+DASK_MIN_BYTES = 4 * 1024 ** 3
+
+# Raw TLC column names -> standard names
+COLUMN_MAP = {
+    'tpep_pickup_datetime': 'pickup_time',
+    'tpep_dropoff_datetime': 'dropoff_time',
+    'lpep_pickup_datetime': 'pickup_time',
+    'lpep_dropoff_datetime': 'dropoff_time',
+    'PULocationID': 'pickup_loc',
+    'DOLocationID': 'dropoff_loc',
+    'fare_amount': 'fare',
+    'tip_amount': 'tip',
+}
+
+# Columns kept after renaming
+KEEP_COLUMNS = ['pickup_time', 'dropoff_time', 'pickup_loc', 'dropoff_loc',
+                'trip_distance', 'fare', 'total_amount', 'congestion_surcharge', 'tip']
+
+# Narrowest dtypes that hold the TLC value ranges
+COLUMN_DTYPES = {
+    'pickup_loc': 'int16', 'dropoff_loc': 'int16',
+    'hour': 'int8', 'day_of_week': 'int8', 'month': 'int8',
+    'fare': 'float32', 'total_amount': 'float32', 'trip_distance': 'float32',
+    'congestion_surcharge': 'float32', 'tip': 'float32',
+    'trip_duration': 'float32', 'avg_speed': 'float32',
+}
+
+# Row groups of ~1 day of trips let readers skip date ranges using
+# min/max statistics
+ROW_GROUP_SIZE = 100_000
+
+# Parquet writer settings: fast zstd, dictionary-encode location IDs only
+# (dictionaries on high-cardinality floats cost CPU for no size gain)
+PARQUET_OPTIONS = {
+    'compression': 'zstd',
+    'compression_level': 1,
+    'use_dictionary': ['pickup_loc', 'dropoff_loc'],
+    'write_statistics': True,
+    'data_page_size': 1 << 20,
+}
+
+
+def _speed(distance, duration):
+    """Average MPH per trip; NaN where the duration is not positive"""
+    dur_h = duration / 60.0
+    out = np.full(len(dur_h), np.nan, dtype=np.float32)
+    np.divide(distance, dur_h, out=out, where=dur_h > 0)
+    return out
+
+
+def _add_speed(p):
+    return p.assign(avg_speed=_speed(p['trip_distance'].to_numpy(),
+                                     p['trip_duration'].to_numpy()))
+
+
+def _calendar_fields(pickup):
+    """Hour, day of week (Mon=0) and month from a datetime64 array"""
+    hours = pickup.astype('datetime64[h]').astype(np.int64)
+    hour = (hours % 24).astype(np.int8)
+    # 1970-01-01 was a Thursday
+    day_of_week = ((hours // 24 + 3) % 7).astype(np.int8)
+    month = (pickup.astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+    return hour, day_of_week, month
+
+
+def _add_calendar(p):
+    hour, day_of_week, month = _calendar_fields(p['pickup_time'].to_numpy())
+    return p.assign(hour=hour, day_of_week=day_of_week, month=month)
+
+
+def write_parquet(data, path, compute=True):
+    """Write a pyarrow Table or Dask frame, replacing any previous output"""
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+    if isinstance(data, pa.Table):
+        # Stream one row group at a time through a single writer
+        with pq.ParquetWriter(path, data.schema, **PARQUET_OPTIONS) as writer:
+            for start in range(0, data.num_rows, ROW_GROUP_SIZE):
+                writer.write_table(data.slice(start, ROW_GROUP_SIZE),
+                                   row_group_size=ROW_GROUP_SIZE)
+        return None
+    return data.to_parquet(path, write_index=False, compute=compute,
+                           row_group_size=ROW_GROUP_SIZE, **PARQUET_OPTIONS)
+
 
 class TLCScraper:
     def __init__(self, download_dir="data/raw", processed_dir="data/processed"):
@@ -26,68 +120,110 @@ class TLCScraper:
 
         print(f"⬇️  Downloading {filename}...")
         try:
-            response = requests.get(url, stream=True, timeout=300)
-            response.raise_for_status()
-
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # Parquet is already compressed - ask for the raw bytes
+            headers = {'Accept-Encoding': 'identity'}
+            with requests.get(url, stream=True, timeout=300, headers=headers) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+
+                with open(filepath, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=1024 * 1024)
             print(f"✅ Downloaded: {filename}")
             return filepath
         except Exception as e:
             print(f"❌ Error: {e}")
             return None
 
-    def process_file(self, filepath):
-        """Process parquet file with Dask (memory efficient)"""
+    def load_file(self, filepath):
+        """Load a trip file with standard columns.
+
+        Returns a pyarrow Table, or a lazy Dask frame for files too big for memory.
+        """
         print(f"⚙️  Processing {filepath.name}...")
 
-        # Use Dask for big data processing
+        if filepath.stat().st_size > DASK_MIN_BYTES:
+            return self._load_dask(filepath)
+        return self._load_arrow(filepath)
+
+    def _load_arrow(self, filepath):
+        """Single-file path: plain Arrow kernels, no scheduler overhead"""
+        # Show columns
+        raw_columns = pq.read_schema(filepath).names
+        print(f"   Columns: {raw_columns}")
+
+        # Decode only the raw columns that map to KEEP_COLUMNS
+        columns = [c for c in raw_columns if COLUMN_MAP.get(c, c) in KEEP_COLUMNS]
+        table = pq.read_table(filepath, columns=columns)
+
+        # Rename to standard names, in KEEP_COLUMNS order
+        table = table.rename_columns([COLUMN_MAP.get(c, c) for c in table.column_names])
+        table = table.select([c for c in KEEP_COLUMNS if c in table.column_names])
+
+        # TLC files already store timestamps - only parse when they don't
+        for name in ('pickup_time', 'dropoff_time'):
+            if not pa.types.is_timestamp(table.schema.field(name).type):
+                table = table.set_column(table.schema.get_field_index(name), name,
+                                         pc.cast(table[name], pa.timestamp('us')))
+
+        # Add computed columns
+        pickup = table['pickup_time']
+        dropoff = table['dropoff_time']
+        for name, values in zip(('hour', 'day_of_week', 'month'),
+                                _calendar_fields(pickup.to_numpy())):
+            table = table.append_column(name, pa.array(values))
+
+        # Calculate trip duration and speed
+        duration = pc.divide(pc.microseconds_between(pickup, dropoff), 60_000_000.0)
+        table = table.append_column('trip_duration', duration)
+        table = table.append_column('avg_speed', pa.array(_speed(
+            table['trip_distance'].to_numpy(), duration.to_numpy())))
+
+        # Downcast to shrink the working set
+        schema = pa.schema([
+            f.with_type(pa.from_numpy_dtype(np.dtype(COLUMN_DTYPES[f.name])))
+            if f.name in COLUMN_DTYPES else f
+            for f in table.schema
+        ])
+        table = table.cast(schema)
+
+        # Sort by pickup time so row groups cover disjoint time ranges
+        return table.sort_by('pickup_time')
+
+    def _load_dask(self, filepath):
+        """Out-of-core path for files larger than DASK_MIN_BYTES"""
         ddf = dd.read_parquet(filepath)
 
         # Show columns
         print(f"   Columns: {list(ddf.columns)}")
 
-        # Basic cleaning - rename columns to standard names
-        column_map = {}
-        if 'tpep_pickup_datetime' in ddf.columns:
-            column_map['tpep_pickup_datetime'] = 'pickup_time'
-        if 'tpep_dropoff_datetime' in ddf.columns:
-            column_map['tpep_dropoff_datetime'] = 'dropoff_time'
-        if 'lpep_pickup_datetime' in ddf.columns:
-            column_map['lpep_pickup_datetime'] = 'pickup_time'
-        if 'lpep_dropoff_datetime' in ddf.columns:
-            column_map['lpep_dropoff_datetime'] = 'dropoff_time'
-        if 'PULocationID' in ddf.columns:
-            column_map['PULocationID'] = 'pickup_loc'
-        if 'DOLocationID' in ddf.columns:
-            column_map['DOLocationID'] = 'dropoff_loc'
-        if 'fare_amount' in ddf.columns:
-            column_map['fare_amount'] = 'fare'
-        if 'tip_amount' in ddf.columns:
-            column_map['tip_amount'] = 'tip'
-
-        ddf = ddf.rename(columns=column_map)
-
-        # Keep only needed columns
-        keep_cols = ['pickup_time', 'dropoff_time', 'pickup_loc', 'dropoff_loc',
-                     'trip_distance', 'fare', 'total_amount', 'congestion_surcharge', 'tip']
-        keep_cols = [c for c in keep_cols if c in ddf.columns]
-        ddf = ddf[keep_cols]
+        # Rename to standard names and keep only needed columns
+        ddf = ddf.rename(columns={k: v for k, v in COLUMN_MAP.items() if k in ddf.columns})
+        ddf = ddf[[c for c in KEEP_COLUMNS if c in ddf.columns]]
+
+        # TLC files already store timestamps - only parse when they don't
+        if not pd.api.types.is_datetime64_any_dtype(ddf['pickup_time'].dtype):
+            ddf['pickup_time'] = dd.to_datetime(ddf['pickup_time'])
 
         # Add computed columns
-        ddf['pickup_time'] = dd.to_datetime(ddf['pickup_time'])
-        ddf['hour'] = ddf['pickup_time'].dt.hour
-        ddf['day_of_week'] = ddf['pickup_time'].dt.dayofweek
-        ddf['month'] = ddf['pickup_time'].dt.month
+        ddf = ddf.map_partitions(_add_calendar)
 
         # Calculate trip duration and speed
         ddf['trip_duration'] = (ddf['dropoff_time'] - ddf['pickup_time']).dt.total_seconds() / 60
-        ddf['avg_speed'] = ddf['trip_distance'] / (ddf['trip_duration'] / 60)
+        ddf = ddf.map_partitions(_add_speed)
+
+        # Downcast to shrink the working set
+        ddf = ddf.astype({c: t for c, t in COLUMN_DTYPES.items() if c in ddf.columns})
+
+        # Sort by pickup time so row groups cover disjoint time ranges
+        return ddf.sort_values('pickup_time')
+
+    def process_file(self, filepath):
+        """Process a trip file and save it with standard columns"""
+        data = self.load_file(filepath)
 
         # Save processed file
         output_name = self.processed_dir / f"processed_{filepath.stem}.parquet"
-        ddf.to_parquet(output_name, overwrite=True)
+        write_parquet(data, output_name)
         print(f"💾 Saved: {output_name}")
 
         return output_name